@@ -0,0 +1,116 @@
+import os
+import hmac
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+FILE_SERVER_HOST = os.getenv('FILE_SERVER_HOST', '0.0.0.0')
+FILE_SERVER_PORT = int(os.getenv('FILE_SERVER_PORT', '8080'))
+# URL pública con la que los usuarios llegan al servidor (p. ej. https://midominio.com)
+DOMAIN_URL = os.getenv('DOMAIN_URL')
+LINK_TTL = int(os.getenv('LINK_TTL_HOURS', '24')) * 3600
+EXPIRE_INTERVAL = 60
+
+
+class FileServer:
+    """Servidor de descargas local con enlaces firmados que caducan.
+
+    aiohttp sirve los archivos con sendfile y responde a Range, If-Range y
+    ETag, así que los clientes pueden reanudar descargas interrumpidas.
+    """
+
+    def __init__(self, public_url: Optional[str], host: str = FILE_SERVER_HOST, port: int = FILE_SERVER_PORT):
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.host = host
+        self.port = port
+        # Los enlaces de una ejecución anterior dejan de ser válidos al reiniciar
+        self._secret = os.getenv('FILE_SERVER_SECRET', '').encode() or secrets.token_bytes(32)
+        # file_id -> (ruta, caducidad, callback al caducar)
+        self._files = {}
+        self._runner = None
+        self._expirer = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.public_url is not None
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    def _sign(self, file_id: str, expires: int) -> str:
+        message = f"{file_id}:{expires}".encode()
+        return hmac.new(self._secret, message, hashlib.sha256).hexdigest()[:32]
+
+    async def start(self):
+        """Arranca el servidor (idempotente)"""
+        if not self.enabled or self.running:
+            return
+
+        app = web.Application()
+        app.router.add_get('/dl/{file_id}/{filename}', self._handle_download)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+        except OSError:
+            await runner.cleanup()
+            raise
+
+        self._runner = runner
+        self._expirer = asyncio.get_event_loop().create_task(self._expire_loop())
+        logger.info(f"✅ Servidor de archivos en {self.host}:{self.port} ({self.public_url})")
+
+    def publish(self, path: Path, ttl: int = LINK_TTL, on_expire=None) -> tuple:
+        """Publica un archivo y devuelve (enlace firmado, timestamp de caducidad)"""
+        file_id = secrets.token_urlsafe(12)
+        expires = int(time.time()) + ttl
+        self._files[file_id] = (path, expires, on_expire)
+
+        url = f"{self.public_url}/dl/{file_id}/{quote(path.name)}?e={expires}&s={self._sign(file_id, expires)}"
+        return url, expires
+
+    async def _handle_download(self, request: web.Request) -> web.StreamResponse:
+        file_id = request.match_info['file_id']
+        try:
+            expires = int(request.query.get('e', ''))
+        except ValueError:
+            raise web.HTTPForbidden()
+
+        if not hmac.compare_digest(request.query.get('s', ''), self._sign(file_id, expires)):
+            raise web.HTTPForbidden()
+
+        entry = self._files.get(file_id)
+        if entry is None or expires < time.time() or not entry[0].is_file():
+            raise web.HTTPGone(text="El enlace ha caducado")
+
+        path = entry[0]
+        return web.FileResponse(path, headers={
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(path.name)}",
+            'Cache-Control': 'private, max-age=0',
+        })
+
+    async def _expire_loop(self):
+        while True:
+            await asyncio.sleep(EXPIRE_INTERVAL)
+            now = time.time()
+            for file_id, (path, expires, on_expire) in list(self._files.items()):
+                if expires >= now:
+                    continue
+                self._files.pop(file_id, None)
+                logger.info(f"⌛ Enlace caducado: {path.name}")
+                if on_expire:
+                    try:
+                        await on_expire()
+                    except Exception as e:
+                        logger.error(f"Error liberando {path.name}: {e}")
@@ -6,23 +6,22 @@ import zipfile
 import shutil
 import tempfile
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import Optional
 import threading
 import time
 import re
-import requests
+import uuid
 import json
 import ssl
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from yt_dlp import YoutubeDL
+# requests, spotipy y yt_dlp se importan al usarse: cargarlos retrasa el arranque del bot
 from dotenv import load_dotenv
 import discord
 
+from Functions.Music.file_server import FileServer, DOMAIN_URL
+
 # Configuración
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -30,7 +29,6 @@ logger = logging.getLogger(__name__)
 
 # Usar directorio temporal del sistema
 TEMP_DIR = Path(tempfile.gettempdir()) / 'spotify_downloads'
-TEMP_DIR.mkdir(exist_ok=True)
 
 # Spotify config
 SPOTIFY_CONFIG = {
@@ -41,12 +39,53 @@ SPOTIFY_CONFIG = {
     'refresh_token': os.getenv('REFRESH_TOKEN')
 }
 
+# Descargas
+MAX_WORKERS = 6
+# Pistas en vuelo por trabajo: la enumeración nunca va más allá de esta ventana
+MAX_IN_FLIGHT = MAX_WORKERS * 2
+# Hilos que conducen trabajos (enumeración y ventana de pistas), aparte del executor
+# por defecto para que los trabajos largos no dejen sin hilos al resto del bot
+MAX_JOB_DRIVERS = int(os.getenv('MAX_JOB_DRIVERS', '16'))
+# Pistas descargándose a la vez entre todos los trabajos
+TRACK_SLOTS = int(os.getenv('TRACK_SLOTS', str(MAX_WORKERS * 2)))
+# Duración media asumida cuando no hay estimación previa del trabajo
+DEFAULT_TRACK_DURATION = 240
+MP3_BITRATE_KBPS = 192
+# Segundos por pista (por worker) asumidos hasta medir el rendimiento real
+DEFAULT_TRACK_SECONDS = 20.0
+# Coincidencias guardadas por el modo de prueba para la descarga real (LRU con caducidad)
+MATCH_CACHE_SIZE = 20000
+MATCH_CACHE_TTL = 6 * 3600
+# Estimaciones de tamaño guardadas por el modo de prueba (LRU)
+ESTIMATE_CACHE_SIZE = 100
+
+# Almacenamiento temporal
+# Cuota de admisión: un trabajo nuevo solo empieza si su primer bloque cabe en ella.
+# Los trabajos ya admitidos crecen por bloques mientras quede disco físico, así que
+# una playlist de 10k pistas (~57 GB a 192 kbps) cabe si el disco lo permite.
+STORAGE_QUOTA_BYTES = int(os.getenv('STORAGE_QUOTA_MB', '4096')) * 1024 * 1024
+# Margen de disco libre que nunca se reserva
+DISK_SAFETY_BYTES = 256 * 1024 * 1024
+# Pistas reservadas de golpe; las pistas terminadas van directas al ZIP
+RESERVE_CHUNK_TRACKS = 50
+# Límite aparte para los ZIP publicados en el servidor local; no cuentan para la cuota
+PUBLISHED_QUOTA_BYTES = int(os.getenv('PUBLISHED_QUOTA_MB', '8192')) * 1024 * 1024
+JANITOR_INTERVAL = 300
+# Artefactos sin trabajo activo se consideran abandonados pasado este tiempo
+ABANDONED_AFTER = 900
+# Tiempo máximo que un trabajo espera en cola por espacio
+STORAGE_QUEUE_TIMEOUT = 1800
+
 class FileHostUploader:
     """Clase para subir archivos a servicios de hosting gratuitos"""
     
     @staticmethod
     def get_robust_session():
         """Crear sesión robusta con reintentos y configuración SSL"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
         session = requests.Session()
         
         # Configurar reintentos
@@ -161,26 +200,365 @@ class FileHostUploader:
         logger.error("No se pudo subir a ningún servicio")
         return None
 
+class StorageManager:
+    """Controla el espacio reservado por cada trabajo en TEMP_DIR y limpia lo abandonado"""
+    
+    def __init__(self, root: Path, quota: int):
+        self.root = root
+        self.quota = quota
+        # job_id -> (bytes reservados, rutas del trabajo)
+        self._jobs = {}
+        # job_id -> bytes de su primer bloque; solo esto cuenta contra la cuota
+        self._admitted = {}
+        # prioridad -> trabajos esperando admisión
+        self._waiting = {}
+        # job_id -> (bytes, rutas) de archivos publicados hasta que caduca su enlace
+        self._published = {}
+        self._cond = None
+        self._janitor = None
+    
+    @property
+    def reserved(self) -> int:
+        return sum(nbytes for nbytes, _ in list(self._jobs.values()))
+    
+    @property
+    def admitted(self) -> int:
+        return sum(list(self._admitted.values()))
+    
+    @property
+    def published(self) -> int:
+        return sum(nbytes for nbytes, _ in list(self._published.values()))
+    
+    @staticmethod
+    def _disk_usage(path: Path) -> int:
+        """Bytes ocupados por un archivo o directorio"""
+        try:
+            if path.is_file():
+                return path.stat().st_size
+            return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+        except OSError:
+            return 0
+    
+    def _disk_available(self) -> int:
+        """Bytes de disco libres que no están ya comprometidos por otra reserva"""
+        # Lo reservado que todavía no está escrito ya está comprometido
+        pending = 0
+        for nbytes, paths in list(self._jobs.values()):
+            pending += max(0, nbytes - sum(self._disk_usage(p) for p in paths))
+        return shutil.disk_usage(self.root).free - pending - DISK_SAFETY_BYTES
+    
+    def _available(self) -> int:
+        """Bytes que aún se pueden admitir según la cuota y el disco libre"""
+        # Lo que crecen los trabajos ya admitidos no cuenta: una playlist enorme
+        # no debe dejar la cuota llena para todos los demás
+        return min(self.quota - self.admitted, self._disk_available())
+    
+    def _condition(self) -> asyncio.Condition:
+        # Se crea en el loop del bot, no al importar
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+    
+    async def _wait_for_space(self, nbytes: int, available, on_wait=None, job=None, blocked=None):
+        """Espera (con la condición tomada) hasta que available() deje sitio para nbytes
+        y blocked(), si se indica, deje de impedir el paso"""
+        cond = self._condition()
+        deadline = time.monotonic() + STORAGE_QUEUE_TIMEOUT
+        notified = False
+        while (blocked is not None and blocked()) or nbytes > await asyncio.to_thread(available):
+            if job is not None:
+                job.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if nbytes > await asyncio.to_thread(self._disk_available):
+                    raise Exception("No hay espacio en disco suficiente, inténtalo más tarde")
+                raise Exception("La cuota de descargas está llena, inténtalo más tarde")
+            if on_wait and not notified:
+                notified = True
+                await on_wait()
+            # Se revisa periódicamente por si el disco se libera fuera del bot
+            try:
+                await asyncio.wait_for(cond.wait(), timeout=min(5, remaining))
+            except asyncio.TimeoutError:
+                pass
+    
+    async def reserve(self, job_id: str, nbytes: int, paths: list, on_wait=None, job=None):
+        """Admite un trabajo reservando su primer bloque, esperando en cola si no cabe en la cuota.
+        
+        Como en TrackSlots, ningún trabajo se admite mientras espere otro de mayor prioridad.
+        """
+        if nbytes > self.quota:
+            raise Exception(f"El trabajo necesita ~{_format_size(nbytes)} y supera la cuota de {_format_size(self.quota)}")
+        
+        priority = job.priority if job is not None else 0
+        cond = self._condition()
+        async with cond:
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+            try:
+                await self._wait_for_space(
+                    nbytes, self._available, on_wait, job,
+                    blocked=lambda: any(p > priority and n for p, n in self._waiting.items())
+                )
+            finally:
+                self._waiting[priority] -= 1
+                cond.notify_all()
+            self._jobs[job_id] = (nbytes, list(paths))
+            self._admitted[job_id] = nbytes
+        logger.info(f"💾 Reservados {_format_size(nbytes)} para {job_id} ({_format_size(self.reserved)} en uso)")
+    
+    async def reserve_small(self, job_id: str, nbytes: int, paths: list, job=None):
+        """Reserva para una pista suelta sin pasar por la cola de admisión.
+        
+        Son unos pocos MB y ya compiten por TrackSlots, así que solo se limitan por
+        el disco físico: una playlist esperando cuota no retrasa la vía rápida.
+        """
+        async with self._condition():
+            await self._wait_for_space(nbytes, self._disk_available, None, job)
+            self._jobs[job_id] = (nbytes, list(paths))
+    
+    async def grow(self, job_id: str, nbytes: int, job=None):
+        """Amplía la reserva de un trabajo ya admitido.
+        
+        Solo se limita por el disco físico: si también contase la cuota, dos trabajos
+        grandes a medias podrían bloquearse esperando el uno al otro.
+        """
+        async with self._condition():
+            await self._wait_for_space(nbytes, self._disk_available, None, job)
+            if job_id in self._jobs:
+                reserved, paths = self._jobs[job_id]
+                self._jobs[job_id] = (reserved + nbytes, paths)
+    
+    async def publish(self, job_id: str, nbytes: int) -> bool:
+        """Pasa un trabajo terminado a publicado, liberando su cuota de admisión.
+        
+        Devuelve False si los archivos publicados superarían PUBLISHED_QUOTA_BYTES.
+        """
+        cond = self._condition()
+        async with cond:
+            if job_id not in self._jobs or self.published + nbytes > PUBLISHED_QUOTA_BYTES:
+                return False
+            _, paths = self._jobs.pop(job_id)
+            self._admitted.pop(job_id, None)
+            self._published[job_id] = (nbytes, paths)
+            cond.notify_all()
+        return True
+    
+    async def release(self, job_id: str):
+        """Libera la reserva de un trabajo y despierta a los que esperan"""
+        cond = self._condition()
+        async with cond:
+            self._admitted.pop(job_id, None)
+            released = self._jobs.pop(job_id, None) or self._published.pop(job_id, None)
+            if released is not None:
+                cond.notify_all()
+    
+    def sweep(self):
+        """Elimina artefactos de trabajos terminados o abandonados"""
+        entries = list(self._jobs.values()) + list(self._published.values())
+        active = {p for _, paths in entries for p in paths}
+        current_time = time.time()
+        try:
+            for file in self.root.glob("*"):
+                if file in active:
+                    continue
+                if current_time - file.stat().st_mtime > ABANDONED_AFTER:
+                    if file.is_file():
+                        file.unlink()
+                    elif file.is_dir():
+                        shutil.rmtree(file, ignore_errors=True)
+                    logger.info(f"🧹 Eliminado artefacto abandonado: {file.name}")
+        except Exception as e:
+            logger.error(f"Error limpiando: {e}")
+    
+    def start_janitor(self):
+        """Arranca la limpieza periódica en segundo plano (idempotente)"""
+        self.root.mkdir(exist_ok=True)
+        if self._janitor is None or self._janitor.done():
+            self._janitor = asyncio.get_event_loop().create_task(self._janitor_loop())
+    
+    async def _janitor_loop(self):
+        while True:
+            await asyncio.to_thread(self.sweep)
+            await asyncio.sleep(JANITOR_INTERVAL)
+
+_storage = StorageManager(TEMP_DIR, STORAGE_QUOTA_BYTES)
+# Entrega local; solo se activa si DOMAIN_URL está configurado
+_file_server = FileServer(DOMAIN_URL)
+
+class JobCancelled(Exception):
+    """El trabajo fue cancelado con /cancel"""
+    
+    def __init__(self, message: str = "Descarga cancelada"):
+        super().__init__(message)
+
+class DownloadJob:
+    """Trabajo de /get_playlist que se puede cancelar desde otro comando"""
+    
+    def __init__(self, name: str, owner_id: Optional[int] = None, owner_name: str = "", priority: int = 0):
+        self.id = uuid.uuid4().hex[:6]
+        self.name = name
+        self.owner_id = owner_id
+        self.owner_name = owner_name
+        self.priority = priority
+        self.created = time.time()
+        self.processed = 0
+        self.total = 0
+        self._cancel = threading.Event()
+        self._procs = set()
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+    
+    def cancel(self):
+        """Marca el trabajo como cancelado y termina sus subprocesos en curso"""
+        self._cancel.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            try:
+                proc.terminate()
+            except OSError:
+                pass
+    
+    def check(self):
+        """Lanza JobCancelled si el trabajo fue cancelado"""
+        if self.cancelled:
+            raise JobCancelled()
+    
+    def track_process(self, proc: subprocess.Popen):
+        with self._lock:
+            self._procs.add(proc)
+        # Cancelado justo mientras arrancaba
+        if self.cancelled:
+            proc.terminate()
+    
+    def untrack_process(self, proc: subprocess.Popen):
+        with self._lock:
+            self._procs.discard(proc)
+
+class TrackSlots:
+    """Huecos de descarga compartidos entre trabajos.
+    
+    Un hueco libre se entrega siempre al trabajo de mayor prioridad que espera,
+    así un trabajo prioritario adelanta a los largos en el límite de cada pista.
+    """
+    
+    def __init__(self, size: int):
+        self._free = size
+        # prioridad -> pistas esperando hueco
+        self._waiting = {}
+        self._cond = threading.Condition()
+    
+    def acquire(self, job: DownloadJob) -> bool:
+        """Espera un hueco; devuelve False si el trabajo se cancela mientras espera"""
+        with self._cond:
+            self._waiting[job.priority] = self._waiting.get(job.priority, 0) + 1
+            try:
+                while not job.cancelled and (
+                    self._free == 0 or any(p > job.priority and n for p, n in self._waiting.items())
+                ):
+                    self._cond.wait(timeout=1)
+                if job.cancelled:
+                    return False
+                self._free -= 1
+                return True
+            finally:
+                self._waiting[job.priority] -= 1
+                self._cond.notify_all()
+    
+    def release(self):
+        with self._cond:
+            self._free += 1
+            self._cond.notify_all()
+
+class TrackRecord:
+    """Pista compacta: solo los campos que usa el pipeline de descarga"""
+    __slots__ = ('id', 'name', 'artist', 'duration')
+    
+    # Campos pedidos a la API para no recibir álbumes, imágenes, mercados...
+    API_FIELDS = "items(track(id,name,duration_ms,artists(name))),next"
+    
+    def __init__(self, id: str, name: str, artist: str, duration: int):
+        self.id = id
+        self.name = name
+        self.artist = artist
+        self.duration = duration
+    
+    @classmethod
+    def from_spotify(cls, track: dict) -> 'TrackRecord':
+        return cls(
+            track['id'],
+            track['name'],
+            ", ".join([a["name"] for a in track["artists"]]),
+            (track.get('duration_ms') or 0) // 1000,
+        )
+    
+    def __str__(self) -> str:
+        return f"{self.artist} - {self.name}"
+
 class SpotifyDownloader:
     def __init__(self):
-        self.ffmpeg_ok = self._check_ffmpeg()
+        # Se completan en create(); el constructor no hace E/S
+        self.ffmpeg_ok = False
         self.sp = None
-        self._init_spotify()
+        # Coincidencias del modo de prueba (id de Spotify -> ({'url', 'duration'}, guardada en)).
+        # La descarga real consume cada entrada, así que no crece con cada pista descargada
+        self._matches = OrderedDict()
+        self._matches_lock = threading.Lock()
+        # Media móvil de segundos por pista descargada
+        self._track_seconds = None
+        # Bytes por pista estimados por el modo de prueba (tipo:id -> bytes)
+        self._estimates = OrderedDict()
+        # Trabajos en curso (id -> DownloadJob)
+        self.jobs = {}
+        self._slots = TrackSlots(TRACK_SLOTS)
+        self._job_executor = ThreadPoolExecutor(max_workers=MAX_JOB_DRIVERS, thread_name_prefix='spotifier-job')
+    
+    @classmethod
+    async def create(cls) -> 'SpotifyDownloader':
+        """Crea el downloader con el token, la sonda de FFmpeg y yt-dlp preparados en paralelo"""
+        self = cls()
+        start = time.monotonic()
+        ffmpeg_ok, _, _ = await asyncio.gather(
+            asyncio.to_thread(self._check_ffmpeg),
+            asyncio.to_thread(self._init_spotify),
+            asyncio.to_thread(self._init_extractors),
+        )
+        self.ffmpeg_ok = ffmpeg_ok
+        logger.info(f"✅ Downloader listo en {time.monotonic() - start:.2f}s")
+        return self
     
     def _init_spotify(self):
         """Inicializar cliente de Spotify"""
         try:
+            import spotipy
+            from spotipy.cache_handler import MemoryCacheHandler
+            from spotipy.oauth2 import SpotifyOAuth
+            
             if not SPOTIFY_CONFIG['client_secret'] or not SPOTIFY_CONFIG['refresh_token']:
                 raise Exception("Faltan credenciales de Spotify en el .env")
-                
-            auth = SpotifyOAuth(**{k: v for k, v in SPOTIFY_CONFIG.items() if k != 'refresh_token'})
-            token = auth.refresh_access_token(SPOTIFY_CONFIG['refresh_token'])
-            self.sp = spotipy.Spotify(auth=token['access_token'])
+            
+            # El token queda en memoria y spotipy lo renueva solo al caducar
+            auth = SpotifyOAuth(**{k: v for k, v in SPOTIFY_CONFIG.items() if k != 'refresh_token'},
+                                cache_handler=MemoryCacheHandler())
+            auth.refresh_access_token(SPOTIFY_CONFIG['refresh_token'])
+            self.sp = spotipy.Spotify(auth_manager=auth)
             logger.info("✅ Spotify inicializado correctamente")
         except Exception as e:
             logger.error(f"Error inicializando Spotify: {e}")
             raise
     
+    @staticmethod
+    def _init_extractors():
+        """Importa yt-dlp y carga el extractor de YouTube antes del primer trabajo"""
+        from yt_dlp import YoutubeDL
+        
+        with YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+            ydl.get_info_extractor('Youtube')
+            ydl.get_info_extractor('YoutubeSearch')
+    
     def _check_ffmpeg(self) -> bool:
         """Verificar si FFmpeg está disponible"""
         try:
@@ -196,23 +574,25 @@ class SpotifyDownloader:
         """Limpia nombres para archivos"""
         return text.translate(str.maketrans('\\/.:*?"<>|', '__________')).strip()[:50]
     
-    def _extract_playlist_id(self, url: str) -> Optional[str]:
-        """Extrae el ID de playlist de diferentes formatos de URL de Spotify"""
+    def _parse_source(self, url: str) -> Optional[tuple]:
+        """Extrae (tipo, ID) de URLs de playlist, álbum, pista o artista de Spotify"""
         patterns = [
-            r'open\.spotify\.com/playlist/([a-zA-Z0-9]+)',
-            r'spotify:playlist:([a-zA-Z0-9]+)',
-            r'spotify\.com/playlist/([a-zA-Z0-9]+)',
+            r'open\.spotify\.com/(?:intl-[a-zA-Z-]+/)?(playlist|album|track|artist)/([a-zA-Z0-9]+)',
+            r'spotify:(playlist|album|track|artist):([a-zA-Z0-9]+)',
+            r'spotify\.com/(?:intl-[a-zA-Z-]+/)?(playlist|album|track|artist)/([a-zA-Z0-9]+)',
         ]
         
         for pattern in patterns:
             match = re.search(pattern, url)
             if match:
-                return match.group(1)
+                return match.group(1), match.group(2)
         
         return None
     
-    def _search_youtube(self, track: str, artist: str, duration: int = 0) -> Optional[str]:
-        """Busca en YouTube"""
+    def _search_youtube(self, track: str, artist: str, duration: int = 0) -> Optional[dict]:
+        """Busca en YouTube y devuelve {'url', 'duration'} del mejor resultado"""
+        from yt_dlp import YoutubeDL
+        
         opts = {
             'quiet': True,
             'no_warnings': True,
@@ -229,26 +609,170 @@ class SpotifyDownloader:
                     return None
                 
                 if not duration:
-                    return entries[0].get('url')
+                    best_match = entries[0]
+                else:
+                    best_match = min(entries, key=lambda x: abs((x.get('duration') or 0) - duration))
                 
-                best_match = min(entries, key=lambda x: abs(x.get('duration', 0) - duration))
-                return best_match.get('url')
+                if not best_match.get('url'):
+                    return None
+                return {'url': best_match['url'], 'duration': best_match.get('duration') or duration}
                 
         except Exception as e:
             logger.debug(f"Error buscando en YouTube: {e}")
             return None
     
-    def _download_track(self, url: str, path: Path, name: str) -> Optional[Path]:
+    def _resolve_track(self, track: TrackRecord, keep: bool = False) -> Optional[dict]:
+        """Resuelve la coincidencia en YouTube de una pista, usando la caché si existe.
+        
+        keep=True (modo de prueba) guarda la coincidencia; si no, se consume de la caché.
+        """
+        with self._matches_lock:
+            entry = self._matches.pop(track.id, None)
+            if entry and time.time() - entry[1] < MATCH_CACHE_TTL:
+                if keep:
+                    self._matches[track.id] = entry
+                return entry[0]
+        
+        match = self._search_youtube(self.clean_name(track.name), self.clean_name(track.artist), track.duration)
+        
+        # Solo se guardan los aciertos; los fallos se reintentan en la siguiente ejecución
+        if match and keep:
+            with self._matches_lock:
+                self._matches[track.id] = (match, time.time())
+                while len(self._matches) > MATCH_CACHE_SIZE:
+                    self._matches.popitem(last=False)
+        return match
+    
+    def _record_track_time(self, seconds: float):
+        """Actualiza la media móvil de segundos por pista"""
+        with self._matches_lock:
+            if self._track_seconds is None:
+                self._track_seconds = seconds
+            else:
+                self._track_seconds = 0.8 * self._track_seconds + 0.2 * seconds
+    
+    def _open_source(self, kind: str, source_id: str) -> tuple:
+        """Abre una fuente como (clave, nombre, total, generador de TrackRecord).
+        
+        Se llama una sola vez por comando: valida la fuente y su resultado se pasa tal cual
+        a la descarga o al modo de prueba, sin repetir llamadas a la API.
+        """
+        key = f"{kind}:{source_id}"
+        
+        if kind == 'playlist':
+            playlist = self.sp.playlist(source_id, fields="name,tracks.total")
+            return key, playlist['name'], playlist['tracks']['total'], self._iter_tracks(source_id)
+        
+        if kind == 'album':
+            # La respuesta del álbum ya incluye la primera página de pistas
+            album = self.sp.album(source_id)
+            return key, album['name'], album['tracks']['total'], self._iter_album_tracks(album['tracks'])
+        
+        if kind == 'artist':
+            artist = self.sp.artist(source_id)
+            tracks = [TrackRecord.from_spotify(t) for t in self.sp.artist_top_tracks(source_id)['tracks'] if t.get('id')]
+            return key, f"{artist['name']} - Top", len(tracks), iter(tracks)
+        
+        track = TrackRecord.from_spotify(self.sp.track(source_id))
+        return key, str(track), 1, iter([track])
+    
+    def _iter_album_tracks(self, page: dict):
+        """Genera las pistas de un álbum siguiendo su paginación de 50 en 50"""
+        while page:
+            for track in page['items']:
+                if track and track.get('id'):
+                    yield TrackRecord.from_spotify(track)
+            page = self.sp.next(page) if page['next'] else None
+    
+    def _iter_tracks(self, playlist_id: str):
+        """Genera las pistas válidas de una playlist página a página"""
+        offset = 0
+        while True:
+            results = self.sp.playlist_items(playlist_id, limit=100, offset=offset,
+                                             fields=TrackRecord.API_FIELDS)
+            for item in results['items']:
+                if item['track'] and item['track'].get('id'):
+                    yield TrackRecord.from_spotify(item['track'])
+            if not results['next']: 
+                break
+            offset += 100
+    
+    @staticmethod
+    def _run_bounded(fn, items, job: DownloadJob):
+        """Aplica fn a items en paralelo con como mucho MAX_IN_FLIGHT pistas pendientes"""
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            pending = set()
+            for item in items:
+                if job.cancelled:
+                    break
+                if len(pending) >= MAX_IN_FLIGHT:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(fn, item))
+            # Las pistas en cola que aún no han empezado se descartan
+            if job.cancelled:
+                for future in pending:
+                    future.cancel()
+            for future in wait(pending).done:
+                if not future.cancelled():
+                    future.result()
+    
+    async def _run_job(self, fn, *args):
+        """Ejecuta la parte bloqueante de un trabajo en el executor de trabajos"""
+        return await asyncio.get_running_loop().run_in_executor(self._job_executor, fn, *args)
+    
+    def _start_job(self, job: Optional[DownloadJob], name: str) -> DownloadJob:
+        if job is None:
+            job = DownloadJob(name)
+        self.jobs[job.id] = job
+        return job
+    
+    def _finish_job(self, job: DownloadJob):
+        self.jobs.pop(job.id, None)
+    
+    def _track_bytes(self, source_key: str) -> int:
+        """Bytes estimados por pista: la media del modo de prueba o una duración típica"""
+        # La descarga real consume la estimación del modo de prueba
+        track_bytes = self._estimates.pop(source_key, None)
+        if track_bytes is None:
+            track_bytes = DEFAULT_TRACK_DURATION * MP3_BITRATE_KBPS * 1000 // 8
+        return track_bytes
+    
+    def _convert_to_mp3(self, source: Path, target: Path, job: DownloadJob) -> bool:
+        """Convierte a MP3 con FFmpeg; el proceso se termina si el trabajo se cancela"""
+        cmd = [
+            "ffmpeg", "-loglevel", "quiet", "-y", "-i", str(source),
+            "-vn", "-codec:a", "libmp3lame", "-b:a", f"{MP3_BITRATE_KBPS}k", str(target)
+        ]
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+        job.track_process(proc)
+        try:
+            returncode = proc.wait()
+        finally:
+            job.untrack_process(proc)
+        
+        if returncode != 0 or job.cancelled:
+            target.unlink(missing_ok=True)
+            return False
+        return True
+    
+    def _download_track(self, url: str, path: Path, name: str, job: DownloadJob) -> Optional[Path]:
         """Descarga una pista"""
-        temp = f"temp_{hash(url) % 10000}"
+        from yt_dlp import YoutubeDL
+        from yt_dlp.utils import DownloadCancelled
+        
+        temp = f"temp_{uuid.uuid4().hex[:8]}"
+        
+        def cancel_hook(_):
+            # yt-dlp aborta la descarga en curso en el siguiente fragmento
+            if job.cancelled:
+                raise DownloadCancelled("Descarga cancelada")
+        
         opts = {
             "format": "bestaudio/best",
             "outtmpl": str(path / f"{temp}.%(ext)s"),
-            "postprocessors": [{
-                "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
-                "preferredquality": "192",
-            }] if self.ffmpeg_ok else [],
+            "progress_hooks": [cancel_hook],
             'quiet': True,
             'no_warnings': True,
             'socket_timeout': 15,
@@ -259,81 +783,114 @@ class SpotifyDownloader:
             with YoutubeDL(opts) as ydl:
                 ydl.download([url])
             
-            extensions = ['*.mp3', '*.m4a', '*.webm', '*.opus'] if not self.ffmpeg_ok else ['*.mp3']
-            for ext in extensions:
-                for f in path.glob(f"{temp}{ext}"):
-                    final = path / f"{name}.mp3"
+            final = path / f"{name}.mp3"
+            for f in path.glob(f"{temp}.*"):
+                if f.suffix in ('.part', '.ytdl'):
+                    continue
+                if not self.ffmpeg_ok:
                     f.rename(final)
                     return final
+                converted = self._convert_to_mp3(f, final, job)
+                f.unlink(missing_ok=True)
+                return final if converted else None
                     
         except Exception as e:
             logger.debug(f"Error descargando: {e}")
-            return None
+        finally:
+            # Restos parciales si la descarga se interrumpió
+            for f in path.glob(f"{temp}.*"):
+                f.unlink(missing_ok=True)
+        return None
+    
+    def _track_filename(self, track: TrackRecord) -> str:
+        return f"{self.clean_name(track.artist)} - {self.clean_name(track.name)}"
     
-    def _process_track(self, track_data: tuple) -> bool:
+    def _process_track(self, track: TrackRecord, path: Path, job: DownloadJob, progress_callback=None) -> Optional[Path]:
         """Procesa una pista - versión para ThreadPoolExecutor"""
-        track, path, progress_callback = track_data
+        filename = self._track_filename(track)
         
-        name = self.clean_name(track["name"])
-        artist = self.clean_name(", ".join([a["name"] for a in track["artists"]]))
-        filename = f"{artist} - {name}"
+        # Punto de preempción: los trabajos prioritarios consiguen hueco antes
+        if not self._slots.acquire(job):
+            return None
+        try:
+            start = time.monotonic()
+            match = self._resolve_track(track)
+            
+            if not match:
+                if progress_callback:
+                    progress_callback("fail")
+                return None
+            
+            file = self._download_track(match['url'], path, filename, job)
+            if file is not None:
+                self._record_track_time(time.monotonic() - start)
+        finally:
+            self._slots.release()
         
-        if list(path.glob(f"*{name}*.mp3")) or list(path.glob(f"*{name}*.m4a")):
-            if progress_callback:
-                progress_callback("skip")
-            return True
+        if job.cancelled:
+            return None
         
-        duration = track.get('duration_ms', 0) // 1000 if track.get('duration_ms') else 0
-        url = self._search_youtube(name, artist, duration)
+        if progress_callback:
+            progress_callback("success" if file is not None else "fail")
         
-        if not url:
-            if progress_callback:
-                progress_callback("fail")
-            return False
+        return file
+    
+    async def _deliver(self, job_id: str, job_dir: Path, file_path: Path) -> tuple:
+        """Entrega un archivo y devuelve (enlace, caducidad o None si es permanente).
         
-        file = self._download_track(url, path, filename)
-        success = file is not None
+        Con el servidor local el archivo se queda publicado hasta que caduca el enlace.
+        """
+        # Servidor local: el enlace está listo sin subir nada, si queda sitio para publicar
+        if _file_server.running and await _storage.publish(job_id, file_path.stat().st_size):
+            
+            async def expire():
+                await asyncio.to_thread(shutil.rmtree, job_dir, ignore_errors=True)
+                await _storage.release(job_id)
+            
+            return _file_server.publish(file_path, on_expire=expire)
         
-        if progress_callback:
-            progress_callback("success" if success else "fail")
+        # Subir a la nube
+        download_url = await asyncio.to_thread(FileHostUploader.upload_file, file_path)
         
-        return success
+        # Limpiar archivo local
+        await asyncio.to_thread(shutil.rmtree, job_dir, ignore_errors=True)
+        
+        if not download_url:
+            raise Exception("No se pudo subir el archivo a la nube")
+        
+        return download_url, None
     
-    async def download_playlist(self, url: str, message_updater=None) -> Optional[str]:
-        """Descarga playlist y la sube a la nube"""
+    async def download_playlist(self, source: tuple, message_updater=None, job: Optional[DownloadJob] = None) -> tuple:
+        """Descarga una playlist, álbum o top de artista y devuelve (enlace, caducidad o None si es permanente)"""
+        # El ZIP publicado en el servidor local conserva su reserva hasta que caduca el enlace
+        handed_off = False
         try:
-            playlist_id = self._extract_playlist_id(url)
-            if not playlist_id:
-                raise Exception("No se pudo extraer el ID de la playlist")
+            source_key, source_name, total, tracks = source
+            name = self.clean_name(source_name)
+            job = self._start_job(job, name)
+            job.total = total
             
-            playlist = self.sp.playlist(playlist_id)
-            name = self.clean_name(playlist['name'])
+            if not total:
+                raise Exception("No se encontraron pistas válidas")
             
-            # Crear directorio temporal único
-            temp_id = str(int(time.time()))
-            path = TEMP_DIR / f"{name}_{temp_id}"
-            path.mkdir(exist_ok=True)
+            # Reservar espacio antes de crear nada en disco
+            job_id = f"{name}_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+            job_dir = TEMP_DIR / job_id
+            path = job_dir / "tracks"
+            zip_path = job_dir / f"{name}.zip"
+            track_bytes = self._track_bytes(source_key)
+            # Primer bloque más las pistas que se descargan a la vez antes de entrar al ZIP
+            estimated_bytes = (min(total, RESERVE_CHUNK_TRACKS) + MAX_WORKERS) * track_bytes
             
-            if message_updater:
-                await message_updater(f"📋 **{name}**\n⏳ Obteniendo pistas...")
-            
-            # Obtener pistas
-            tracks = []
-            offset = 0
-            while True:
-                results = self.sp.playlist_items(playlist_id, limit=100, offset=offset)
-                valid_tracks = [item['track'] for item in results['items'] 
-                              if item['track'] and item['track'].get('id')]
-                tracks.extend(valid_tracks)
-                if not results['next']: 
-                    break
-                offset += 100
+            async def notify_queued():
+                if message_updater:
+                    await message_updater(f"📋 **{name}**\n⏳ En cola: esperando {_format_size(estimated_bytes)} de espacio en disco...")
             
-            if not tracks:
-                raise Exception("No se encontraron pistas válidas")
+            await _storage.reserve(job_id, estimated_bytes, [job_dir], notify_queued, job)
+            path.mkdir(parents=True, exist_ok=True)
             
             if message_updater:
-                await message_updater(f"📋 **{name}**\n🎵 {len(tracks)} pistas encontradas\n📊 Descargando: 0/{len(tracks)} (✅0 ❌0)")
+                await message_updater(f"📋 **{name}**\n🎵 {total} pistas encontradas\n📊 Descargando: 0/{total} (✅0 ❌0)")
             
             # Contadores thread-safe
             downloaded = 0
@@ -354,68 +911,286 @@ class SpotifyDownloader:
                         skipped += 1
                     
                     total_processed = downloaded + failed
+                    job.processed = total_processed
                     
                     # Actualizar cada 3 pistas o al final
-                    if total_processed % 3 == 0 or total_processed == len(tracks):
+                    if total_processed % 3 == 0 or total_processed == total:
                         if message_updater:
-                            progress_msg = f"📋 **{name}**\n🎵 {len(tracks)} pistas encontradas\n📊 Descargando: {total_processed}/{len(tracks)} (✅{downloaded} ❌{failed})"
+                            progress_msg = f"📋 **{name}**\n🎵 {total} pistas encontradas\n📊 Descargando: {total_processed}/{total} (✅{downloaded} ❌{failed})"
                             current_loop.call_soon_threadsafe(
                                 lambda: asyncio.create_task(message_updater(progress_msg))
                             )
             
-            track_data = [(track, path, sync_callback) for track in tracks]
+            def reserve_by_chunks(tracks):
+                # Amplía la reserva un bloque por delante de la enumeración
+                reserved_tracks = RESERVE_CHUNK_TRACKS
+                for i, track in enumerate(tracks):
+                    if i >= reserved_tracks:
+                        asyncio.run_coroutine_threadsafe(
+                            _storage.grow(job_id, RESERVE_CHUNK_TRACKS * track_bytes, job), current_loop
+                        ).result()
+                        reserved_tracks += RESERVE_CHUNK_TRACKS
+                    yield track
             
-            # Descargar en paralelo
-            with ThreadPoolExecutor(max_workers=6) as executor:
-                await current_loop.run_in_executor(
-                    executor, 
-                    lambda: list(executor.map(self._process_track, track_data))
-                )
+            # Cada pista terminada entra al ZIP y se borra, así solo ocupa espacio el ZIP.
+            # Sin compresión: los MP3 apenas se comprimen y así el lock dura poco.
+            zf = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED)
+            zip_lock = threading.Lock()
+            zipped = set()
+            audio_files = 0
             
-            if message_updater:
-                await message_updater(f"📋 **{name}**\n✅ Descarga completada: {downloaded}/{len(tracks)}\n📦 Creando ZIP y subiendo...")
+            def download_to_zip(track: TrackRecord):
+                nonlocal audio_files
+                filename = f"{self._track_filename(track)}.mp3"
+                # Pistas repetidas en la fuente: solo se descargan una vez
+                with zip_lock:
+                    if filename in zipped:
+                        sync_callback("skip")
+                        return
+                    zipped.add(filename)
+                
+                file = self._process_track(track, path, job, sync_callback)
+                with zip_lock:
+                    if file is None:
+                        zipped.discard(filename)
+                        return
+                    zf.write(file, file.name)
+                    audio_files += 1
+                file.unlink(missing_ok=True)
             
-            # Crear ZIP
-            zip_path = TEMP_DIR / f"{name}.zip"
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                audio_files = list(path.glob("*.mp3")) + list(path.glob("*.m4a"))
-                for audio_file in audio_files:
-                    zf.write(audio_file, audio_file.name)
+            def run():
+                try:
+                    self._run_bounded(download_to_zip, reserve_by_chunks(tracks), job)
+                finally:
+                    zf.close()
+            
+            # Descargar en paralelo mientras se enumera la playlist
+            await self._run_job(run)
+            job.check()
+            
+            if downloaded + failed == 0:
+                raise Exception("No se encontraron pistas válidas")
+            
+            if message_updater:
+                await message_updater(f"📋 **{name}**\n✅ Descarga completada: {downloaded}/{downloaded + failed}\n📦 Preparando el enlace...")
             
             # Limpiar directorio temporal
-            shutil.rmtree(path, ignore_errors=True)
+            await asyncio.to_thread(shutil.rmtree, path, ignore_errors=True)
             
             if not audio_files:
                 raise Exception("No se descargaron archivos de audio")
             
-            # Subir a la nube
-            download_url = FileHostUploader.upload_file(zip_path)
+            download_url, expires = await self._deliver(job_id, job_dir, zip_path)
+            handed_off = expires is not None
+            return download_url, expires
+            
+        except JobCancelled:
+            logger.info(f"🛑 Trabajo cancelado: {job.id}")
+            if 'job_dir' in locals() and job_dir.exists():
+                await asyncio.to_thread(shutil.rmtree, job_dir, ignore_errors=True)
+            raise
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            # Limpiar en caso de error
+            if 'job_dir' in locals() and job_dir.exists():
+                await asyncio.to_thread(shutil.rmtree, job_dir, ignore_errors=True)
+            raise
+        finally:
+            if 'job_id' in locals() and not handed_off:
+                await _storage.release(job_id)
+            if job is not None:
+                self._finish_job(job)
+
+    async def download_single(self, source: tuple, message_updater=None, job: Optional[DownloadJob] = None,
+                              send_file=None) -> tuple:
+        """Vía rápida para una sola pista: sin ZIP y con prioridad sobre las descargas largas.
+        
+        Si send_file acepta el MP3 devuelve (None, None); si no, (enlace, caducidad).
+        """
+        handed_off = False
+        try:
+            _, _, _, tracks = source
+            track = next(tracks)
+            job = self._start_job(job, str(track))
+            job.total = 1
+            job.priority = max(job.priority, 1)
+            
+            job_id = f"{self.clean_name(track.name)}_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+            job_dir = TEMP_DIR / job_id
+            # Archivo original más el MP3 convertido
+            estimated_bytes = (track.duration or DEFAULT_TRACK_DURATION) * MP3_BITRATE_KBPS * 1000 // 8 * 2
+            await _storage.reserve_small(job_id, estimated_bytes, [job_dir], job)
+            job_dir.mkdir(parents=True, exist_ok=True)
+            
+            if message_updater:
+                await message_updater(f"🎵 **{track}**\n⏳ Descargando...")
+            
+            file = await self._run_job(self._process_track, track, job_dir, job)
+            job.check()
+            job.processed = 1
             
-            # Limpiar archivo local
-            if zip_path.exists():
-                zip_path.unlink()
+            if file is None:
+                raise Exception("No se pudo descargar la pista")
             
-            if not download_url:
-                raise Exception("No se pudo subir el archivo a la nube")
+            if send_file and await send_file(file):
+                return None, None
             
-            return download_url
+            download_url, expires = await self._deliver(job_id, job_dir, file)
+            handed_off = expires is not None
+            return download_url, expires
             
         except Exception as e:
-            logger.error(f"Error: {e}")
-            # Limpiar en caso de error
-            if 'path' in locals() and path.exists():
-                shutil.rmtree(path, ignore_errors=True)
-            if 'zip_path' in locals() and zip_path.exists():
-                zip_path.unlink()
+            if not isinstance(e, JobCancelled):
+                logger.error(f"Error: {e}")
             raise
+        finally:
+            if 'job_id' in locals() and not handed_off:
+                await asyncio.to_thread(shutil.rmtree, job_dir, ignore_errors=True)
+                await _storage.release(job_id)
+            if job is not None:
+                self._finish_job(job)
+    
+    async def resolve_playlist(self, source: tuple, message_updater=None, job: Optional[DownloadJob] = None) -> dict:
+        """Modo de prueba: resuelve las coincidencias sin descargar y estima el coste del trabajo"""
+        source_key, source_name, total, tracks = source
+        name = self.clean_name(source_name)
+        job = self._start_job(job, name)
+        job.total = total
+        
+        if message_updater:
+            await message_updater(f"📋 **{name}**\n🔎 Resolviendo: 0/{total}")
+        
+        resolved = 0
+        # Solo se guardan unas pocas pistas sin coincidencia para el informe
+        unresolved = []
+        unresolved_count = 0
+        total_seconds = 0
+        progress_lock = threading.Lock()
+        current_loop = asyncio.get_event_loop()
+        
+        def resolve(track: TrackRecord):
+            nonlocal resolved, unresolved_count, total_seconds
+            if job.cancelled:
+                return
+            match = self._resolve_track(track, keep=True)
+            with progress_lock:
+                if match:
+                    resolved += 1
+                    total_seconds += match['duration'] or 0
+                else:
+                    unresolved_count += 1
+                    if len(unresolved) < 10:
+                        unresolved.append(str(track))
+                
+                total_processed = resolved + unresolved_count
+                job.processed = total_processed
+                if total_processed % 10 == 0 or total_processed == total:
+                    if message_updater:
+                        progress_msg = f"📋 **{name}**\n🔎 Resolviendo: {total_processed}/{total} (✅{resolved} ❌{unresolved_count})"
+                        current_loop.call_soon_threadsafe(
+                            lambda: asyncio.create_task(message_updater(progress_msg))
+                        )
+        
+        try:
+            await self._run_job(self._run_bounded, resolve, tracks, job)
+            job.check()
+        finally:
+            self._finish_job(job)
+        
+        if resolved + unresolved_count == 0:
+            raise Exception("No se encontraron pistas válidas")
+        
+        # El tamaño sale de la duración de cada vídeo al bitrate de salida
+        estimated_bytes = total_seconds * MP3_BITRATE_KBPS * 1000 // 8
+        if resolved:
+            self._estimates.pop(source_key, None)
+            self._estimates[source_key] = estimated_bytes // resolved
+            while len(self._estimates) > ESTIMATE_CACHE_SIZE:
+                self._estimates.popitem(last=False)
+        track_seconds = self._track_seconds or DEFAULT_TRACK_SECONDS
+        estimated_seconds = resolved * track_seconds / MAX_WORKERS
+        
+        return {
+            'name': name,
+            'total': resolved + unresolved_count,
+            'resolved': resolved,
+            'unresolved': unresolved,
+            'unresolved_count': unresolved_count,
+            'estimated_bytes': estimated_bytes,
+            'estimated_seconds': estimated_seconds,
+            'measured': self._track_seconds is not None,
+        }
 
 # Instancia global
 _downloader = None
+_warm_up_task = None
 
-async def set_up(ctx, url: str, bot):
-    """Función principal con mensajes optimizados"""
+async def _start_file_server():
+    try:
+        await _file_server.start()
+    except Exception as e:
+        logger.error(f"No se pudo arrancar el servidor de archivos, se usarán servicios externos: {e}")
+
+async def _warm_up() -> SpotifyDownloader:
     global _downloader
-    
+    _downloader, _ = await asyncio.gather(SpotifyDownloader.create(), _start_file_server())
+    return _downloader
+
+def _log_warm_up(task: asyncio.Task):
+    # Recoge el error aunque ningún comando espere la tarea
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error(f"❌ Error preparando el downloader: {error}")
+
+def start_warm_up():
+    """Prepara el downloader y el limpiador en segundo plano (llamar desde on_ready)"""
+    global _warm_up_task
+    _storage.start_janitor()
+    if _downloader is None and (_warm_up_task is None or _warm_up_task.done()):
+        _warm_up_task = asyncio.get_event_loop().create_task(_warm_up())
+        _warm_up_task.add_done_callback(_log_warm_up)
+
+async def get_downloader() -> SpotifyDownloader:
+    """Devuelve el downloader, esperando al calentamiento si aún está en marcha"""
+    if _downloader is not None:
+        return _downloader
+    # Si el calentamiento falló o se canceló, se vuelve a intentar con este trabajo
+    if _warm_up_task is None or (_warm_up_task.done() and (_warm_up_task.cancelled() or _warm_up_task.exception())):
+        start_warm_up()
+    return await asyncio.shield(_warm_up_task)
+
+def _format_size(num_bytes: int) -> str:
+    """Formatea un tamaño en bytes de forma legible"""
+    for unit in ('B', 'KB', 'MB'):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+def _format_duration(seconds: float) -> str:
+    """Formatea una duración en segundos como 1h 05m / 3m 20s"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    return f"{minutes}m {secs:02d}s"
+
+SOURCE_LABELS = {
+    'playlist': "📋 Playlist",
+    'album': "💿 Álbum",
+    'artist': "🎤 Artista (top)",
+    'track': "🎵 Pista",
+}
+
+def _is_admin(ctx) -> bool:
+    permissions = getattr(ctx.user, 'guild_permissions', None)
+    return bool(permissions and permissions.administrator)
+
+async def set_up(ctx, url: str, bot, dry_run: bool = False, priority: bool = False):
+    """Función principal con mensajes optimizados"""
     try:
         # Responder inmediatamente para evitar timeout
         await ctx.response.defer()
@@ -424,7 +1199,7 @@ async def set_up(ctx, url: str, bot):
         if _downloader is None:
             initial_message = await ctx.followup.send("🔧 Inicializando downloader...", wait=True)
             try:
-                _downloader = SpotifyDownloader()
+                await get_downloader()
             except Exception as e:
                 await initial_message.edit(content=f"❌ Error inicializando: {str(e)}")
                 return
@@ -436,17 +1211,24 @@ async def set_up(ctx, url: str, bot):
             await initial_message.edit(content="❌ No se proporcionó una URL.")
             return
         
-        playlist_id = _downloader._extract_playlist_id(url)
-        if not playlist_id:
-            await initial_message.edit(content="❌ URL de Spotify inválida.\n**Formatos válidos:**\n• `https://open.spotify.com/playlist/ID`\n• `spotify:playlist:ID`")
+        source = _downloader._parse_source(url)
+        if not source:
+            await initial_message.edit(content="❌ URL de Spotify inválida.\n**Formatos válidos:**\n• `https://open.spotify.com/playlist/ID` (también `album`, `track` y `artist`)\n• `spotify:playlist:ID`")
             return
+        kind = source[0]
         
         try:
-            playlist = _downloader.sp.playlist(playlist_id, fields="name,public")
+            # Consulta la API de Spotify: fuera del event loop
+            opened = await asyncio.to_thread(_downloader._open_source, *source)
+            source_name = opened[1]
         except Exception as e:
-            await initial_message.edit(content=f"❌ No se pudo acceder a la playlist: {str(e)}")
+            await initial_message.edit(content=f"❌ No se pudo acceder a la URL: {str(e)}")
             return
         
+        # Solo los administradores pueden adelantar su trabajo a los demás
+        job = DownloadJob(source_name, ctx.user.id, str(ctx.user),
+                          priority=1 if priority and _is_admin(ctx) else 0)
+        
         # Función para actualizar el mensaje de progreso
         async def update_progress(message: str):
             try:
@@ -454,23 +1236,79 @@ async def set_up(ctx, url: str, bot):
             except Exception as e:
                 logger.debug(f"Error actualizando mensaje: {e}")
         
-        # Descargar y subir
-        download_url = await _downloader.download_playlist(url, update_progress)
+        if dry_run:
+            report = await _downloader.resolve_playlist(opened, update_progress, job)
+            await update_progress(f"📋 **{report['name']}**\n✅ Estimación completada")
+            
+            match_rate = report['resolved'] / report['total'] * 100
+            embed = discord.Embed(
+                title="🔎 Estimación de la descarga",
+                description="No se ha descargado nada. Las coincidencias quedan guardadas para la descarga real.",
+                color=0x1DB954
+            )
+            embed.add_field(name=SOURCE_LABELS[kind], value=f"**{source_name}**", inline=False)
+            embed.add_field(name="🎯 Coincidencias", value=f"{report['resolved']}/{report['total']} ({match_rate:.0f}%)", inline=True)
+            embed.add_field(name="💾 Tamaño estimado", value=_format_size(report['estimated_bytes']), inline=True)
+            embed.add_field(name="⏱️ Duración estimada", value=_format_duration(report['estimated_seconds']), inline=True)
+            if report['unresolved']:
+                extra = report['unresolved_count'] - len(report['unresolved'])
+                value = "\n".join(f"• {t[:80]}" for t in report['unresolved'])
+                if extra:
+                    value += f"\n… y {extra} más"
+                embed.add_field(name="❌ Sin coincidencia", value=value, inline=False)
+            if not report['measured']:
+                embed.set_footer(text="Duración aproximada: aún no hay descargas medidas")
+            
+            await ctx.followup.send(embed=embed)
+            return
+        
+        if kind == 'track':
+            # Vía rápida: el MP3 va adjunto si cabe en el límite del servidor
+            async def send_file(file_path: Path) -> bool:
+                limit = ctx.guild.filesize_limit if ctx.guild else 10 * 1024 * 1024
+                if file_path.stat().st_size > limit:
+                    return False
+                await ctx.followup.send(content=f"🎵 **{source_name}**", file=discord.File(file_path))
+                return True
+            
+            download_url, expires = await _downloader.download_single(opened, update_progress, job, send_file)
+            if download_url is None:
+                await update_progress(f"🎵 **{source_name}**\n✅ Descarga completada")
+                return
+            link_label = "📥 Descargar MP3"
+        else:
+            # Descargar y subir
+            download_url, expires = await _downloader.download_playlist(opened, update_progress, job)
+            link_label = "📥 Descargar ZIP"
         
         # Mensaje final con embed
         embed = discord.Embed(
             title="🎵 Descarga Completada",
-            description="Tu playlist está lista para descargar",
+            description="Tu música está lista para descargar",
             color=0x1DB954
         )
-        embed.add_field(name="📋 Playlist", value=f"**{playlist['name']}**", inline=False)
-        embed.add_field(name="🔗 Enlace", value=f"[📥 Descargar ZIP]({download_url})", inline=False)
-        embed.add_field(name="⏰ Válido por", value="Permanente*", inline=True)
-        embed.add_field(name="📦 Formato", value="MP3 (192kbps)", inline=True)
-        embed.set_footer(text="*Según las políticas del servicio de hosting")
+        embed.add_field(name=SOURCE_LABELS[kind], value=f"**{source_name}**", inline=False)
+        embed.add_field(name="🔗 Enlace", value=f"[{link_label}]({download_url})", inline=False)
+        if expires:
+            embed.add_field(name="⏰ Caduca", value=f"<t:{expires}:R>", inline=True)
+            embed.add_field(name="📦 Formato", value="MP3 (192kbps)", inline=True)
+            embed.set_footer(text="La descarga se puede reanudar si se interrumpe")
+        else:
+            embed.add_field(name="⏰ Válido por", value="Permanente*", inline=True)
+            embed.add_field(name="📦 Formato", value="MP3 (192kbps)", inline=True)
+            embed.set_footer(text="*Según las políticas del servicio de hosting")
         
         await ctx.followup.send(embed=embed)
         
+    except JobCancelled:
+        try:
+            await initial_message.edit(content=f"🛑 Descarga cancelada: **{source_name}**")
+        except:
+            try:
+                await ctx.followup.send(f"🛑 Descarga cancelada: **{source_name}**")
+            except:
+                # Último recurso
+                logger.error(f"No se pudo avisar de la cancelación de {source_name}")
     except Exception as e:
         try:
             # Si initial_message existe, editarlo
@@ -483,18 +1321,52 @@ async def set_up(ctx, url: str, bot):
             # Último recurso
             logger.error(f"Error crítico en set_up: {e}")
 
-def cleanup_old_files():
-    """Limpiar archivos temporales antiguos"""
-    try:
-        current_time = time.time()
-        for file in TEMP_DIR.glob("*"):
-            if current_time - file.stat().st_mtime > 3600:  # 1 hora
-                if file.is_file():
-                    file.unlink()
-                elif file.is_dir():
-                    shutil.rmtree(file, ignore_errors=True)
-    except Exception as e:
-        logger.error(f"Error limpiando: {e}")
+async def cancel(ctx, job_id: Optional[str] = None):
+    """Cancela un trabajo propio (o cualquiera, si es administrador)"""
+    jobs = list(_downloader.jobs.values()) if _downloader else []
+    
+    if job_id:
+        job = next((j for j in jobs if j.id == job_id), None)
+    else:
+        own = [j for j in jobs if j.owner_id == ctx.user.id]
+        job = max(own, key=lambda j: j.created) if own else None
+    
+    if job is None:
+        await ctx.response.send_message("❌ No hay ninguna descarga en curso que cancelar.", ephemeral=True)
+        return
+    if job.owner_id != ctx.user.id and not _is_admin(ctx):
+        await ctx.response.send_message("❌ Solo puedes cancelar tus propias descargas.", ephemeral=True)
+        return
+    
+    job.cancel()
+    await ctx.response.send_message(f"🛑 Cancelando `{job.id}` (**{job.name}**)...", ephemeral=True)
 
-# Limpiar al iniciar
-cleanup_old_files()
\ No newline at end of file
+async def list_jobs(ctx):
+    """Lista los trabajos en curso (solo administradores)"""
+    if not _is_admin(ctx):
+        await ctx.response.send_message("❌ Solo para administradores.", ephemeral=True)
+        return
+    
+    jobs = sorted(_downloader.jobs.values(), key=lambda j: j.created) if _downloader else []
+    if not jobs:
+        await ctx.response.send_message("✅ No hay descargas en curso.", ephemeral=True)
+        return
+    
+    embed = discord.Embed(title="📋 Descargas en curso", color=0x1DB954)
+    for job in jobs[:25]:
+        state = "🛑 cancelando" if job.cancelled else f"{job.processed}/{job.total}"
+        flag = " ⚡" if job.priority else ""
+        embed.add_field(
+            name=f"`{job.id}` {job.name[:60]}{flag}",
+            value=f"👤 {job.owner_name} • 📊 {state} • ⏱️ {_format_duration(time.time() - job.created)}",
+            inline=False
+        )
+    embed.add_field(name="🎫 Cuota de admisión", value=f"{_format_size(_storage.admitted)} / {_format_size(_storage.quota)}", inline=True)
+    embed.add_field(name="💾 Disco reservado", value=_format_size(_storage.reserved), inline=True)
+    embed.add_field(name="🔗 Publicado", value=f"{_format_size(_storage.published)} / {_format_size(PUBLISHED_QUOTA_BYTES)}", inline=True)
+    
+    await ctx.response.send_message(embed=embed, ephemeral=True)
+
+def cleanup_old_files():
+    """Limpiar archivos temporales que no pertenecen a ningún trabajo activo"""
+    _storage.sweep()
\ No newline at end of file
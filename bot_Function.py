@@ -1,6 +1,7 @@
 import os
 import discord
 import asyncio
+from typing import Optional
 
 from dotenv import load_dotenv
 from discord import app_commands
@@ -22,6 +23,8 @@ tree = app_commands.CommandTree(bot)
 
 @bot.event
 async def on_ready():
+  # Downloader warm-up runs in the background while the bot syncs commands
+  spotifier.start_warm_up()
   await tree.sync(guild=discord.Object(id=CDiscord))
   channel = bot.get_channel(BLog)
   await channel.send("connected")
@@ -60,11 +63,35 @@ async def DGreat(ctx):
 
 
 @tree.command(name="get_playlist",
-              description="Download a spotify playlist",
+              description="Download a spotify playlist, album, track or artist's top tracks",
               guild=Guild)
-async def DSpotify(ctx, url: str):
+@app_commands.describe(dry_run="Only resolve matches and estimate size and time, without downloading",
+                       priority="Admins only: run ahead of other downloads")
+async def DSpotify(ctx, url: str, dry_run: bool = False, priority: bool = False):
   if ctx.channel == bot.get_channel(CMusic):
-    await spotifier.set_up(ctx, url, bot)
+    await spotifier.set_up(ctx, url, bot, dry_run, priority)
+  else:
+    await Incorrect_channel(ctx)
+
+
+@tree.command(name="cancel",
+              description="Cancel one of your playlist downloads",
+              guild=Guild)
+@app_commands.describe(job_id="Job id shown in /jobs (defaults to your latest download)")
+async def DCancel(ctx, job_id: Optional[str] = None):
+  if ctx.channel == bot.get_channel(CMusic):
+    await spotifier.cancel(ctx, job_id)
+  else:
+    await Incorrect_channel(ctx)
+
+
+@tree.command(name="jobs",
+              description="List running playlist downloads",
+              guild=Guild)
+@app_commands.default_permissions(administrator=True)
+async def DJobs(ctx):
+  if ctx.channel == bot.get_channel(CMusic):
+    await spotifier.list_jobs(ctx)
   else:
     await Incorrect_channel(ctx)
 